@@ -1,15 +1,41 @@
 """ Remedy REST API Functions Wrapper Module """
 
+import functools
+import gzip
 import json
 import logging
-from typing import List, Optional, Tuple
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 ENTRY_PATH = "/arsys/v1/entry/"
 LOGIN_PATH = "/jwt/login"
 LOGOUT_PATH = "/jwt/logout"
-REMEDY_TIMEOUT = 60
+# (connect, read) timeouts: an unreachable server fails fast, while slow
+# workflow processing on the server still has time to complete
+REMEDY_TIMEOUT = (3.05, 60)
+LOGOUT_TIMEOUT = (3.05, 5)
+DEFAULT_POOL_SIZE = 10
+REMEDY_RETRIES = 5
+REMEDY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses where the server has refused a POST without processing it, so that
+# resending it can't create a duplicate entry
+POST_RETRY_STATUSES = (429, 503)
+JSON_HEADERS = {"Content-Type": "application/json"}
+GZIP_JSON_HEADERS = {**JSON_HEADERS, "Content-Encoding": "gzip"}
+COMPRESS_THRESHOLD = 1024
+
+logger = logging.getLogger(__name__)
 
 
 class RemedyException(Exception):
@@ -24,26 +50,152 @@ class RemedyLogoutException(RemedyException):
     """Exception to specifically indicate a problem loogging out of Remedy"""
 
 
+class RemedyResponseError(RemedyException):
+    """Exception to indicate that Remedy returned data in an unexpected shape"""
+
+
+class RemedyRetry(Retry):
+    """Retry policy that only resends a POST when the server has refused it
+    outright; after any other server error the entry may well have been
+    created, and resending would duplicate it"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST" and status_code not in POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def retry_policy() -> Retry:
+    """Build the retry policy applied to all Remedy requests.
+
+    Connection failures, throttling (429) and transient server errors are
+    retried with exponential backoff, honouring any Retry-After header sent by
+    the server. POST requests are only retried on 429 and 503 (see
+    RemedyRetry). Read errors are never retried, as a timed out request may
+    still be processed by the server. Once retries are exhausted the final
+    response is returned so that the usual error handling applies.
+    """
+    return RemedyRetry(
+        total=REMEDY_RETRIES,
+        read=0,
+        backoff_factor=REMEDY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+
+
+def encode_json(values: dict) -> bytes:
+    """Serialise a request body as compact JSON, without the whitespace that
+    requests' own json= encoding would include. Uses orjson if it's installed."""
+    if orjson:
+        return orjson.dumps(values)
+    return json.dumps(values, separators=(",", ":")).encode("UTF-8")
+
+
+@functools.lru_cache(maxsize=16)
+def fields_param(fields: Tuple[str, ...]) -> str:
+    """Build the fields query parameter asking Remedy to return the given
+    field values. Callers use the same few field lists for every entry, so
+    the strings are cached."""
+    return f"values({','.join(fields)})"
+
+
+def decode_json(response: requests.Response) -> dict:
+    """Parse a JSON response body, using orjson if it's installed"""
+    if orjson:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls evenly so that they don't exceed
+    a maximum rate, keeping sustained load within the server's quota"""
+
+    def __init__(self, max_per_second: float):
+        self.interval = 1.0 / max_per_second
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self) -> None:
+        """Block until the caller's slot is due"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class RemedySession:
     """Define a Remedy session class to allow operations to be performed
     against the Remedy server"""
 
-    def __init__(self, api_url: str, username: str, password: str):
+    def __init__(
+        self,
+        api_url: str,
+        username: str,
+        password: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        compress_requests: bool = False,
+        max_requests_per_second: Optional[float] = None,
+    ):
         """Init function: log in to Remedy and retrieve an authentication token
 
         Inputs
             url: Remedy API base URL
             username: Remedy user with suitable form permissions
             password: Password for the Remedy user
+            pool_size: Maximum number of keep-alive connections to hold open
+            compress_requests: gzip request bodies larger than COMPRESS_THRESHOLD
+            max_requests_per_second: Limit on the rate of form requests, if any
         """
         self.remedy_base_url = api_url
-        logging.info(f"Logging in to Helix ITSM as {username}")
-        logging.info(f"============================{'=' * len(username)}")
+        self.login_url = f"{api_url}{LOGIN_PATH}"
+        self.logout_url = f"{api_url}{LOGOUT_PATH}"
+        self.entry_base_url = f"{api_url}{ENTRY_PATH}"
+        self.form_urls: Dict[str, str] = {}
+        self.compress_requests = compress_requests
+        self.rate_limiter = (
+            RateLimiter(max_requests_per_second) if max_requests_per_second else None
+        )
 
-        payload = {"username": username, "password": password}
-        login_url = f"{self.remedy_base_url}{LOGIN_PATH}"
-        logging.debug(login_url)
-        response = requests.post(login_url, data=payload, timeout=REMEDY_TIMEOUT)
+        # A single HTTP session lets every request reuse pooled keep-alive
+        # connections rather than paying for a new TCP/TLS handshake each time
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry_policy(),
+        )
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        # Logout gets no retries, so that a hung server can't hold up shutdown
+        # for longer than LOGOUT_TIMEOUT
+        self.http.mount(self.logout_url, HTTPAdapter(max_retries=0))
+
+        # The credentials are kept so that an expired token can be renewed
+        # part way through a long run
+        self.username = username
+        self._password = password
+        self.login_lock = threading.Lock()
+        self.auth_token = None
+
+        logger.info("Logging in to Helix ITSM as %s", username)
+        logger.info("============================%s", "=" * len(username))
+        try:
+            self._login()
+        except Exception:
+            self.http.close()
+            raise
+
+    def _login(self) -> None:
+        """Request a new authentication token and attach it to the HTTP session"""
+        payload = {"username": self.username, "password": self._password}
+        logger.debug(self.login_url)
+        response = self.http.post(
+            self.login_url, data=payload, timeout=REMEDY_TIMEOUT
+        )
 
         if not response.ok:
             raise RemedyLoginException(
@@ -51,6 +203,7 @@ class RemedySession:
             )
 
         self.auth_token = f"AR-JWT {response.text}"
+        self.http.headers["Authorization"] = self.auth_token
 
     def __enter__(self):
         """Context manager entry method"""
@@ -58,34 +211,88 @@ class RemedySession:
 
     def __exit__(self, exctype, excvalue, traceback):
         """Context manager exit method"""
-        if self.auth_token:
-            self.logout()
+        self.close()
         if exctype:
-            logging.info(f"Exception type was specified! {type}")
-        return True
+            logger.info("Exception type was specified! %s", exctype)
+        # Errors are suppressed, but KeyboardInterrupt and SystemExit must still
+        # stop the script
+        return exctype is None or issubclass(exctype, Exception)
+
+    def close(self) -> None:
+        """Log out if still logged in and release the pooled connections"""
+        # A failed logout only leaves the token to expire on the server, so it
+        # mustn't hold up or abort shutdown
+        try:
+            if self.auth_token:
+                self.logout()
+        except (RemedyLogoutException, requests.RequestException) as err:
+            logger.warning("Logout failed: %s", err)
+        finally:
+            self.http.close()
 
     def logout(self):
         """Request destruction of an active login token"""
         if not self.auth_token:
             raise RemedyLogoutException("No active login session; cannot logout.")
-        headers = {"Authorization": self.auth_token}
-        response = requests.post(
-            f"{self.remedy_base_url}{LOGOUT_PATH}",
-            headers=headers,
-            timeout=REMEDY_TIMEOUT,
-        )
+        response = self.http.post(self.logout_url, timeout=LOGOUT_TIMEOUT)
 
-        logging.info("=================================")
+        logger.info("=================================")
 
         if not response.ok:
             raise RemedyLogoutException(
                 f'Failed to log out of Helix ITSM server: ({response.status_code}) {response.text}"'
             )
-        logging.info("Successful logout from Helix ITSM")
+        logger.info("Successful logout from Helix ITSM")
         self.auth_token = None
+        del self.http.headers["Authorization"]
+
+    def _throttle(self) -> None:
+        """Wait for the rate limiter, if one is configured"""
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a form request, logging in again and retrying once if the
+        server rejects the token as expired"""
+        token = self.auth_token
+        self._throttle()
+        response = self.http.request(method, url, timeout=REMEDY_TIMEOUT, **kwargs)
+        if response.status_code != 401:
+            return response
+
+        # Only one thread renews the token; the others reuse the new one
+        with self.login_lock:
+            if not self.auth_token:
+                raise RemedyLoginException("Remedy login session is no longer valid")
+            if self.auth_token == token:
+                logger.info("Authentication token rejected; logging in again")
+                try:
+                    self._login()
+                except Exception:
+                    # End the session rather than trying again for every
+                    # remaining request, which could lock the Remedy account
+                    self.auth_token = None
+                    self.http.headers.pop("Authorization", None)
+                    raise
+        self._throttle()
+        return self.http.request(method, url, timeout=REMEDY_TIMEOUT, **kwargs)
+
+    def _form_url(self, form: str) -> str:
+        """Return the entry URL for a form, building it on first use"""
+        url = self.form_urls.get(form)
+        if url is None:
+            url = self.form_urls.setdefault(form, f"{self.entry_base_url}{form}")
+        return url
+
+    def _encode_body(self, field_values: dict) -> Tuple[bytes, Dict[str, str]]:
+        """Encode a request body, compressing it if enabled and worthwhile"""
+        body = encode_json(field_values)
+        if self.compress_requests and len(body) > COMPRESS_THRESHOLD:
+            return gzip.compress(body), GZIP_JSON_HEADERS
+        return body, JSON_HEADERS
 
     def create_entry(
-        self, form: str, field_values: dict, fields: Optional[List[str]]
+        self, form: str, field_values: dict, fields: Optional[Sequence[str]]
     ) -> Tuple[str, dict]:
         """Method to create a Remedy form entry
 
@@ -103,28 +310,24 @@ class RemedySession:
                 "Unable to create entry without a valid login session"
             )
 
-        target_url = f"{self.remedy_base_url}{ENTRY_PATH}{form}"
-        headers = {"Authorization": self.auth_token}
-        params = {"fields": f"values({','.join(fields)})"} if fields else None
-
-        logging.debug(json.dumps(field_values, indent=4))
-        logging.debug(target_url)
-        logging.debug(headers)
-        logging.debug(params)
-
-        response = requests.post(
-            target_url,
-            json=field_values,
-            headers=headers,
-            params=params,
-            timeout=REMEDY_TIMEOUT,
+        target_url = self._form_url(form)
+        params = {"fields": fields_param(tuple(fields))} if fields else None
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(field_values, indent=4))
+        logger.debug(target_url)
+        logger.debug(params)
+
+        body, headers = self._encode_body(field_values)
+        response = self._send(
+            "POST", target_url, data=body, headers=headers, params=params
         )
 
         if not response.ok:
             raise RemedyException(f"Failed to create entry: {response.text}")
 
         location = response.headers.get("Location") or ""
-        return location, response.json()
+        return location, decode_json(response)
 
     def modify_entry(self, form: str, field_values: dict, entry_id: str) -> None:
         """Function to modify fields on an existing Remedy incident.
@@ -139,27 +342,25 @@ class RemedySession:
                 "Unable to modify entry without a valid login session"
             )
 
-        logging.debug(f"Going to modify incident ref: {entry_id}")
-        logging.debug(field_values)
-        target_url = f"{self.remedy_base_url}{ENTRY_PATH}{form}/{entry_id}"
-        logging.debug(f"URL: {target_url}")
+        logger.debug("Going to modify incident ref: %s", entry_id)
+        logger.debug(field_values)
+        target_url = f"{self._form_url(form)}/{entry_id}"
+        logger.debug("URL: %s", target_url)
 
-        headers = {"Authorization": self.auth_token}
-        response = requests.put(
-            target_url, json=field_values, headers=headers, timeout=REMEDY_TIMEOUT
-        )
+        body, headers = self._encode_body(field_values)
+        response = self._send("PUT", target_url, data=body, headers=headers)
         if response.ok:
-            logging.debug(f"Incident modified: {target_url}")
+            logger.debug("Incident modified: %s", target_url)
             return
 
-        logging.error(f"Error modifying incident: {response.text}")
+        logger.error("Error modifying incident: %s", response.text)
         raise RemedyException("Failed to modify the incident")
 
     def query_form(
         self,
         form: str,
         query: Optional[str],
-        fields: Optional[List[str]],
+        fields: Optional[Sequence[str]],
         limit: Optional[int],
     ) -> dict:
         """Retrieves entries on a form based on a provided search qualification
@@ -176,9 +377,8 @@ class RemedySession:
         if not self.auth_token:
             raise RemedyException("Unable to get entry without a valid login session")
 
-        target_url = f"{self.remedy_base_url}{ENTRY_PATH}{form}"
-        logging.debug(f"Target URL: {target_url}")
-        headers = {"Authorization": self.auth_token}
+        target_url = self._form_url(form)
+        logger.debug("Target URL: %s", target_url)
 
         params = {}
         if query:
@@ -186,12 +386,10 @@ class RemedySession:
         if limit:
             params["limit"] = limit
         if fields:
-            params["fields"] = f"values({','.join(fields)})"
-        response = requests.get(
-            target_url, headers=headers, params=params, timeout=REMEDY_TIMEOUT
-        )
+            params["fields"] = fields_param(tuple(fields))
+        response = self._send("GET", target_url, params=params)
 
         if response.ok:
-            return response.json()
+            return decode_json(response)
 
         raise RemedyException(f"Error getting entry: {response.text}")
@@ -4,31 +4,86 @@
 # BE CAREFUL! Check configuration carefully before running this script; many
 #   incidents can be created in a short space of time!
 
-import base64
 import binascii
 import datetime
 import json
 import logging
+import os
 import random
 import sys
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
-from bmc.remedy import RemedyException, RemedySession
+from bmc.remedy import RemedyException, RemedyResponseError, RemedySession
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DEBUG_FLAG = False
 
 LOG_LEVEL = logging.DEBUG if DEBUG_FLAG else logging.INFO
-logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
+
+logger = logging.getLogger(__name__)
 
 rest_config = {}
 remedy_config = {}
 customer_config = {}
 runtime_values = {}
 
+# Remedy form names, resolved from the REST config by load_config
+DEFAULT_CREATE_FORM = "HPD:IncidentInterface_Create"
+DEFAULT_MODIFY_FORM = "HPD:IncidentInterface"
+create_form = DEFAULT_CREATE_FORM
+modify_form = DEFAULT_MODIFY_FORM
+
+# Whether the create form honours the status supplied on create, resolved from
+# the REST config by load_config
+create_sets_status = False
+
+# Dedicated generator for incident data, avoiding the module-level random
+# functions' attribute lookups in the generation loop
+_rng = random.Random()
+
+# Static selections derived from the configuration, built once by prepare_choices
+remedy_choices = {}
+company_names = ()
+company_choices = {}
+assignee_groups = {}
+assignee_names = {}
+incident_templates = {}
+
+# Incident fields drawn from the standard Remedy configuration, keyed by the
+# field name with the config key holding the candidate values
+STANDARD_FIELDS = {
+    "Status": "Statuses",
+    "Impact": "Impacts",
+    "Urgency": "Urgencies",
+    "Reported Source": "Sources",
+    "Service_Type": "IncidentTypes",
+}
+
+# Config key holding the status reasons, only drawn for Pending incidents
+PENDING_REASONS_KEY = "PendingReasons"
+
+# Incident fields that are the same for every generated incident
+INCIDENT_TEMPLATE = {"z1D_Action": "CREATE"}
+
+# Fields requested back from Remedy when an incident is created
+CREATE_RETURN_FIELDS = ("Incident Number", "Request ID")
+
+# Statuses that can't be set on create and need a follow-up modify
+MODIFY_STATUSES = frozenset(("In Progress", "Pending"))
+
+# Per-company config keys holding lists of values to choose from
+COMPANY_CHOICE_KEYS = ("ContactLogonIDs", "Services", "CIs")
+
 DEFAULT_TARGET_DAYS = 30
+DEFAULT_MAX_CONCURRENT = 1
 
 
 def get_config_filenames() -> Dict[str, Path]:
@@ -42,87 +97,167 @@ def get_config_filenames() -> Dict[str, Path]:
     }
 
 
+def read_json(path: Path) -> dict:
+    """Parse a JSON file, using orjson if it's installed"""
+    if orjson:
+        return orjson.loads(path.read_bytes())
+    with open(path, "r", encoding="UTF-8") as json_file:
+        return json.load(json_file)
+
+
 def load_config() -> None:
     """Load configuration from external JSON files"""
     # TODO: Improve configuration loading/handling
     global rest_config, remedy_config, customer_config, runtime_values
+    global create_form, modify_form, create_sets_status
     configs = get_config_filenames()
 
     # Load Configuration (Connectivity)
-    with open(configs["rc"], "r", encoding="UTF-8") as rcf:
-        rest_config = json.load(rcf)
+    rest_config = read_json(configs["rc"])
+    create_form = rest_config.get("remedyCreateForm", DEFAULT_CREATE_FORM)
+    modify_form = rest_config.get("remedyModifyForm", DEFAULT_MODIFY_FORM)
+    create_sets_status = rest_config.get("remedyCreateSetsStatus", False)
 
     # Load Configuration (Standard Remedy Elements)
-    with open(configs["sc"], "r", encoding="UTF-8") as scf:
-        remedy_config = json.load(scf)
+    remedy_config = read_json(configs["sc"])
 
     # Load Configuration (Customer Specific Elements)
-    with open(configs["cc"], "r", encoding="UTF-8") as ccf:
-        customer_config = json.load(ccf)
+    customer_config = read_json(configs["cc"])
 
     # Load Configuration (Runtime Values)
-    with open(configs["rv"], "r", encoding="UTF-8") as rvf:
-        runtime_values = json.load(rvf)
+    runtime_values = read_json(configs["rv"])
+
+    prepare_choices()
+
+
+def prepare_choices() -> None:
+    """Flatten the configuration into tuples that can be handed straight to
+    random.choice, so that nothing has to be rebuilt for every incident"""
+    global remedy_choices, company_names, company_choices
+    global assignee_groups, assignee_names, incident_templates
+
+    remedy_choices = {
+        key: tuple(remedy_config.get(key, []))
+        for key in (*STANDARD_FIELDS.values(), PENDING_REASONS_KEY)
+    }
+    company_names = tuple(customer_config)
+    company_choices = {}
+    assignee_groups = {}
+    assignee_names = {}
+    incident_templates = {}
+    for company, company_config in customer_config.items():
+        company_choices[company] = {
+            key: tuple(company_config.get(key, [])) for key in COMPANY_CHOICE_KEYS
+        }
+        assignees = company_config.get("Assignees", {})
+        assignee_groups[company] = tuple(assignees)
+        for group, details in assignees.items():
+            assignee_names[(company, group)] = tuple(
+                details.get("Support Assignees", [])
+            )
+            # Fields fixed by the company and assignee group, ready to be copied
+            incident_templates[(company, group)] = {
+                **INCIDENT_TEMPLATE,
+                "Company": company,
+                "Assigned Support Company": details.get("Support Company"),
+                "Assigned Support Organization": details.get("Support Organisation"),
+                "Assigned Group": group,
+            }
 
 
 def save_config() -> None:
-    """Save runtime Values to file"""
+    """Save runtime Values to file, via a temporary file so that an interrupted
+    write can't leave a truncated config behind"""
     configs = get_config_filenames()
+    temp_file = configs["rv"].with_suffix(".tmp")
 
-    with open(configs["rv"], "w", encoding="UTF-8") as rvw:
+    with open(temp_file, "w", encoding="UTF-8") as rvw:
         json.dump(runtime_values, rvw, indent=4)
+    os.replace(temp_file, configs["rv"])
 
 
 def create_incident(session: RemedySession, incident_request: dict) -> None:
     """Create Remedy incident and modify status if required"""
-    return_fields = ["Incident Number", "Request ID"]
     incident_data = incident_request.get("values", {})
 
     # logging.info(json.dumps(incident_request, indent=4))
     # Create the base incident
-    _, return_data = session.create_entry(
-        rest_config.get("remedyCreateForm", "HPD:IncidentInterface_Create"),
+    location, return_data = session.create_entry(
+        create_form,
         incident_request,
-        return_fields,
+        CREATE_RETURN_FIELDS,
     )
 
-    values = return_data.get("values", {})
-    incident_number = values.get("Incident Number")
-    incident_id = values.get("Request ID")
-    logging.info(
-        f"   +-- Incident {incident_number} created with status Assigned ({incident_id})"
+    try:
+        values = return_data["values"]
+        incident_number = values["Incident Number"]
+    except (KeyError, TypeError) as err:
+        raise RemedyResponseError(
+            f"Create response is missing the Incident Number: {return_data}"
+        ) from err
+    # The Location header ends with the new entry's ID, which stands in for
+    # the Request ID if the form didn't return it
+    incident_id = values.get("Request ID") or location.rpartition("/")[2]
+
+    # Some create forms honour the status supplied on create, in which case the
+    # follow-up lookup and modify calls can be skipped entirely
+    status = incident_data.get("Status", "")
+    created_status = status if create_sets_status else "Assigned"
+    logger.info(
+        "   +-- Incident %s created with status %s (%s)",
+        incident_number,
+        created_status,
+        incident_id,
     )
     if not incident_number:
         raise RemedyException("Failed to create incident")
 
-    status = incident_data.get("Status", "")
-    if status in ["In Progress", "Pending"]:
-        update_incident_status(incident_number, session, status, incident_data)
+    if not create_sets_status and status in MODIFY_STATUSES:
+        # The Request ID returned on create only identifies the entry to modify
+        # when both operations use the same form
+        same_form = create_form == modify_form
+        update_incident_status(
+            incident_number,
+            session,
+            status,
+            incident_data,
+            request_id=incident_id if same_form else None,
+        )
 
 
-def update_incident_status(
-    incident_number: str, session: RemedySession, status: str, incident_data: dict
-) -> None:
-    """Update the status of the incident, also setting the stats reason
-    if the status is set to Pending"""
-
-    # Find the entry ID of the incident in the Incident Modify form
+def find_modify_request_id(session: RemedySession, incident_number: str) -> str:
+    """Find the Request ID of the incident in the Incident Modify form"""
     remedy_query = f"""('Incident Number'="{incident_number}")"""
     response_records = session.query_form(
-        form=rest_config.get("remedyModifyForm", "HPD:IncidentInterface"),
+        form=modify_form,
         query=remedy_query,
-        fields=["Request ID"],
-        limit=None,
+        fields=("Request ID",),
+        limit=1,
     )
 
-    entries = response_records.get("entries")
-    if not isinstance(entries, list):
-        raise TypeError("Expected a list of entries to be returned")
+    try:
+        request_id = response_records["entries"][0]["values"]["Request ID"]
+    except (KeyError, IndexError, TypeError) as err:
+        raise RemedyResponseError(
+            f"No Request ID found in {modify_form} for incident {incident_number}"
+        ) from err
+    logger.debug("Request ID: %s", request_id)
+    return request_id
 
-    entry = entries[0]
-    entry_values = entry.get("values", {})
-    request_id = entry_values.get("Request ID")
-    logging.debug(f"Request ID: {request_id}")
+
+def update_incident_status(
+    incident_number: str,
+    session: RemedySession,
+    status: str,
+    incident_data: dict,
+    request_id: Optional[str] = None,
+) -> None:
+    """Update the status of the incident, also setting the stats reason
+    if the status is set to Pending. The Request ID of the incident in the
+    modify form is looked up if it isn't supplied."""
+
+    if not request_id:
+        request_id = find_modify_request_id(session, incident_number)
 
     # Modify the incident to set status if ticket is "In Progress" or "Pending"
     values = {"Status": status}
@@ -131,11 +266,73 @@ def update_incident_status(
 
     update_body = {"values": values}
     session.modify_entry(
-        rest_config.get("remedyModifyForm", "HPD:IncidentInterface"),
+        modify_form,
         update_body,
         request_id,
     )
-    logging.info(f"   +-- Incident {incident_number} modified to status {status}")
+    logger.info("   +-- Incident %s modified to status %s", incident_number, status)
+
+
+def create_incidents(
+    session: RemedySession,
+    incident_requests: List[dict],
+    first_counter: int,
+    max_workers: int,
+) -> Tuple[int, int]:
+    """Create a batch of incidents concurrently, sharing the session's pooled
+    connections between the worker threads. The pool should hold at least
+    max_workers connections; note that the server's licensing or rate limits
+    may cap the useful level of concurrency.
+
+    Returns the number of incidents created and the number of failures
+    """
+    incidents_created = 0
+    error_count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        try:
+            for offset, incident_request in enumerate(incident_requests):
+                incident_data = incident_request.get("values")
+                if not incident_data:
+                    raise ValueError("Incident generation failed")
+                company = incident_data.get("Company")
+                logger.info(
+                    " * Creating incident %s for company %s...",
+                    first_counter + offset,
+                    company,
+                )
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(json.dumps(incident_request, indent=4))
+                futures.append(
+                    executor.submit(create_incident, session, incident_request)
+                )
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    incidents_created += 1
+                except RemedyException as err:
+                    logger.error("Error: %s", err)
+                    logger.error(traceback.format_exc())
+                    error_count += 1
+                except Exception as err:
+                    logger.error("Error: %s", err)
+                    logger.error(traceback.format_exc())
+                    error_count += 1
+        except BaseException:
+            # Stop on Ctrl-C (or any other failure) without sending the queued
+            # creates; only the requests already in flight are left to finish
+            cancelled = sum(future.cancel() for future in futures)
+            logger.error(
+                "Run stopped after creating %d incidents with %d errors; "
+                "%d queued incidents were not created",
+                incidents_created,
+                error_count,
+                cancelled,
+            )
+            raise
+
+    return incidents_created, error_count
 
 
 def main():
@@ -143,64 +340,113 @@ def main():
     supplied configuration data (see config files)
     """
 
+    logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
     load_config()
     remedy_url = rest_config.get("remedyApiUrl", "")
     remedy_user = rest_config.get("remedyUser", "")
     try:
-        remedy_password = base64.b64decode(
+        remedy_password = binascii.a2b_base64(
             rest_config.get("remedyBase64Password", b"")
         ).decode("UTF-8")
     except (UnicodeDecodeError, binascii.Error):
-        logging.error(
+        logger.error(
             "Couldn't decode password in config file. Please check it's a valid BASE64 string!"
         )
         sys.exit("Failed to read password from config")
 
     script_start_time = time.perf_counter()
-    incidents_created = 0
+    incidents_created = error_count = 0
+
+    # Generate all of the incident data up front so that the worker threads
+    # spend their time waiting on Remedy rather than on random choices
+    incident_count = runtime_values.get("incidentsToCreate", 0)
+    first_counter = runtime_values.get("nextIncidentNumber", 1)
+    incident_requests = generate_random_incidents(first_counter, incident_count)
+    max_concurrent = max(
+        1, runtime_values.get("maxConcurrentRequests", DEFAULT_MAX_CONCURRENT)
+    )
 
-    with RemedySession(remedy_url, remedy_user, remedy_password) as session:
-        error_count = 0
-        for _ in range(runtime_values.get("incidentsToCreate", 0)):
-            incident_counter = runtime_values.get("nextIncidentNumber", 1)
-            incident_request = generate_random_incident(incident_counter)
-            incident_data = incident_request.get("values")
-            if not incident_data:
-                raise ValueError("Incident generation failed")
-            company = incident_data.get("Company")
-            logging.info(
-                f" * Creating incident {incident_counter} for company {company}..."
-            )
-            try:
-                logging.debug(json.dumps(incident_request, indent=4))
-                create_incident(session, incident_request)
-                runtime_values["nextIncidentNumber"] += 1
-                incidents_created += 1
-            except RemedyException as err:
-                logging.error(f"Error: {err}")
-                logging.error(traceback.format_exc())
-                error_count += 1
-            except Exception as err:
-                logging.error(f"Error: {err}")
-                logging.error(traceback.format_exc())
-                error_count += 1
+    session = RemedySession(
+        remedy_url,
+        remedy_user,
+        remedy_password,
+        pool_size=max_concurrent,
+        compress_requests=rest_config.get("remedyCompressRequests", False),
+        max_requests_per_second=rest_config.get("remedyMaxRequestsPerSecond"),
+    )
+
+    # Once logged in, reserve the incident numbers for this run before creating
+    # anything, so that if the run is killed part way through, the next run
+    # can't reuse them. Numbers are consumed even if creation fails, keeping
+    # summaries unique across runs. This happens outside the session's context
+    # manager, which swallows exceptions, so that a failed save stops the run.
+    try:
+        runtime_values["nextIncidentNumber"] = first_counter + incident_count
+        save_config()
+    except BaseException:
+        session.close()
+        raise
+
+    with session:
+        incidents_created, error_count = create_incidents(
+            session, incident_requests, first_counter, max_concurrent
+        )
 
     script_end_time = time.perf_counter()
     script_runtime = script_end_time - script_start_time
-    logging.info("=================================")
-    logging.info(
-        f"Created a total of {incidents_created} incidents in {script_runtime:.2f} seconds."
+    logger.info("=================================")
+    logger.info(
+        "Created a total of %d incidents in %.2f seconds.",
+        incidents_created,
+        script_runtime,
     )
 
     if error_count:
-        logging.info(
-            f"**** Total of {error_count} error{'s'[:error_count^1]} occurred during run ****"
+        logger.info(
+            "**** Total of %d %s occurred during run ****",
+            error_count,
+            "error" if error_count == 1 else "errors",
         )
 
-    save_config()
 
+def generate_random_incidents(
+    first_counter: int, count: int
+) -> List[Dict[str, Dict[str, str]]]:
+    """Generate a batch of incidents, drawing the standard Remedy values and the
+    companies for the whole batch with a single random.choices call per field.
+    Values that depend on the company are still chosen per incident, and all
+    incidents in the batch share a single creation timestamp.
 
-def generate_random_incident(incident_counter: int) -> Dict[str, Dict[str, str]]:
+    Inputs
+        first_counter: Counter value for the first incident in the batch
+        count: The number of incidents to generate
+
+    Outputs
+        incident_requests: List of generated incident structures
+    """
+    columns = [
+        _rng.choices(remedy_choices[key], k=count) for key in STANDARD_FIELDS.values()
+    ]
+    standard_values = [dict(zip(STANDARD_FIELDS, row)) for row in zip(*columns)]
+    # Status reasons are optional config, so only draw them where they're needed
+    pending = [values for values in standard_values if values["Status"] == "Pending"]
+    reasons = _rng.choices(remedy_choices[PENDING_REASONS_KEY], k=len(pending))
+    for values, reason in zip(pending, reasons):
+        values["Status_Reason"] = reason
+    companies = _rng.choices(company_names, k=count)
+    timestamp = str(datetime.datetime.now())
+    return [
+        generate_random_incident(first_counter + offset, values, company, timestamp)
+        for offset, (values, company) in enumerate(zip(standard_values, companies))
+    ]
+
+
+def generate_random_incident(
+    incident_counter: int,
+    standard_values: Dict[str, str],
+    company: str,
+    timestamp: str,
+) -> Dict[str, Dict[str, str]]:
     """This function generates a data structure containing ticket data in a format
     that is ready to push to Remedy's REST API.
 
@@ -209,23 +455,25 @@ def generate_random_incident(incident_counter: int) -> Dict[str, Dict[str, str]]
 
     Inputs
         incident_counter: A number used to ensure each incident summary is unique.
+        standard_values: Pre-drawn selections from the standard Remedy config
+        company: The pre-drawn company to raise the incident for
+        timestamp: Generation time to include in the incident description
 
     Outputs
         incident_request: Dictionary containing the generated incident structure
     """
 
-    description = f"Test incident {incident_counter} created with Incident Blaster: {datetime.datetime.now()}"
+    description = f"Test incident {incident_counter} created with Incident Blaster: {timestamp}"
 
     notes = f"These are the notes for test incident {incident_counter}."
 
     # Standard Remedy Elements
-    status = random.choice(remedy_config.get("Statuses", []))
+    status = standard_values["Status"]
 
     # Customer-specific Elements
-    company = random.choice(list(customer_config.keys()))
-    company_config = customer_config.get(company, {})
-    assignee_group = random.choice(list(company_config.get("Assignees", {}).keys()))
-    support_details = company_config.get("Assignees", {}).get(assignee_group, {})
+    choice = _rng.choice
+    choices = company_choices[company]
+    assignee_group = choice(assignee_groups[company])
 
     # Generate a random time from (now + 60 seconds) to a defined maximum
     # target_epoch = int(time.time()) + random.randint(
@@ -233,30 +481,28 @@ def generate_random_incident(incident_counter: int) -> Dict[str, Dict[str, str]]
     # )
     # target_human = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.localtime(target_epoch))
 
-    values = {
-        "Login_ID": random.choice(company_config.get("ContactLogonIDs", [])),
-        "Description": description,
-        "Detailed_Decription": notes,
-        "Impact": random.choice(remedy_config.get("Impacts", [])),
-        "Urgency": random.choice(remedy_config.get("Urgencies", [])),
-        "Status": status,
-        "Reported Source": random.choice(remedy_config.get("Sources", [])),
-        "Service_Type": random.choice(remedy_config.get("IncidentTypes", [])),
-        "Company": company,
-        "z1D_Action": "CREATE",
-        "ServiceCI": random.choice(company_config.get("Services", [])),
-        "CI Name": random.choice(company_config.get("CIs", [])),
-        "Assigned Support Company": support_details.get("Support Company"),
-        "Assigned Support Organization": support_details.get("Support Organisation"),
-        "Assigned Group": assignee_group,
-        # "Estimated Resolution Date": target_human,
-    }
-    if status in ["In Progress", "Pending"]:
-        values["Assignee"] = random.choice(support_details.get("Support Assignees", []))
+    values = incident_templates[(company, assignee_group)].copy()
+    values.update(
+        {
+            "Login_ID": choice(choices["ContactLogonIDs"]),
+            "Description": description,
+            "Detailed_Decription": notes,
+            "Impact": standard_values["Impact"],
+            "Urgency": standard_values["Urgency"],
+            "Status": status,
+            "Reported Source": standard_values["Reported Source"],
+            "Service_Type": standard_values["Service_Type"],
+            "ServiceCI": choice(choices["Services"]),
+            "CI Name": choice(choices["CIs"]),
+            # "Estimated Resolution Date": target_human,
+        }
+    )
+    if status in MODIFY_STATUSES:
+        values["Assignee"] = choice(assignee_names[(company, assignee_group)])
     if status == "Pending":
-        values["Status_Reason"] = random.choice(remedy_config.get("PendingReasons", []))
+        values["Status_Reason"] = standard_values["Status_Reason"]
 
-    logging.debug(f"Generated incident:\n{values}")
+    logger.debug("Generated incident:\n%s", values)
     return {"values": values}
 
 